@@ -8,16 +8,26 @@ using rule-based logic and AI reasoning (Gemini).
 import os
 import csv
 import io
+import re
+import asyncio
+import hashlib
+import functools
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-import requests
+import httpx
+import diskcache
+import orjson
 from dotenv import load_dotenv
 import logging
-import time
 import random
+from dataclasses import dataclass
+from operator import attrgetter
 
 # Load environment variables
 load_dotenv()
@@ -26,11 +36,183 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Configure Gemini AI (REST)
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "gemini-1.5-flash"
+GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+# Upper bound on in-flight Gemini requests so a large CSV does not burst past the quota
+# (at least 1; a zero-sized semaphore would block every scoring run)
+GEMINI_CONCURRENCY = max(1, int(os.getenv("GEMINI_CONCURRENCY", "8")))
+# Gemini requests-per-minute quota; 0 (or less) disables pacing
+GEMINI_QPM = max(0, int(os.getenv("GEMINI_QPM", "0")))
+# Longest Retry-After (seconds) honoured before falling back to normal backoff
+GEMINI_MAX_RETRY_AFTER = 30.0
+# Number of leads packed into one Gemini prompt
+GEMINI_BATCH_SIZE = 10
+# Maximum number of AI results kept in the in-process LRU cache
+AI_CACHE_SIZE = 4096
+# Directory of the persistent AI result cache; empty disables it. Relative
+# paths are resolved against this file's directory, not the working directory
+AI_DISK_CACHE_DIR = os.getenv("AI_DISK_CACHE_DIR", ".lead_cache")
+if AI_DISK_CACHE_DIR:
+    AI_DISK_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), AI_DISK_CACHE_DIR)
+AI_DISK_CACHE_SIZE_LIMIT = 2 ** 30
+AI_DISK_CACHE_EXPIRE_SECONDS = 7 * 24 * 60 * 60
+# Bump whenever the Gemini prompt or response parsing changes so cached results are not reused
+AI_PROMPT_VERSION = "2"
+# Keep-alive pool for the shared client so TLS handshakes are amortized across leads
+GEMINI_POOL_SIZE = 32
+if not GEMINI_API_KEY:
+    logger.warning("GEMINI_API_KEY not found. AI scoring will use heuristic approach.")
+
+# AI intent -> AI score (0-50 points)
+INTENT_SCORES = {"High": 50, "Medium": 30, "Low": 10}
+# Outermost JSON array in a Gemini reply that is not bare JSON (code fence, prose)
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+
+class GeminiLimiter:
+    """Bound concurrent Gemini requests and pace their starts to a per-minute quota.
+
+    Use as ``async with limiter:`` around each request. Concurrency is capped by
+    a semaphore; when ``qpm`` is set, request starts are spaced ``60 / qpm``
+    seconds apart (a token bucket holding a single token).
+    """
+
+    def __init__(self, concurrency: int, qpm: int = 0):
+        self._sem = asyncio.Semaphore(concurrency)
+        self._interval = 60.0 / qpm if qpm > 0 else 0.0
+        self._next_start = 0.0
+
+    async def __aenter__(self) -> "GeminiLimiter":
+        await self._sem.acquire()
+        if self._interval:
+            # Reserve the next start slot before sleeping so waiters queue in order
+            now = asyncio.get_running_loop().time()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+            if start > now:
+                try:
+                    await asyncio.sleep(start - now)
+                except BaseException:
+                    self._sem.release()
+                    raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._sem.release()
+
+class AIScoreCache:
+    """Cache of Gemini results keyed by (model/prompt/offer, role, industry, profile hash).
+
+    An in-process LRU sits in front of an optional on-disk cache, so results
+    survive restarts and are shared by every worker using the same directory.
+    Disk reads and writes run in the threadpool, one call per batch, so SQLite
+    never blocks the event loop; writes are not awaited by callers and are
+    flushed by ``aclose``. Disk entries expire after
+    ``AI_DISK_CACHE_EXPIRE_SECONDS``. Disk errors, including failing to open
+    the directory, are logged and fall back to memory only; caching never
+    fails scoring.
+    """
+
+    def __init__(self, maxsize: int, directory: Optional[str] = None):
+        self._memory: "OrderedDict[tuple[str, str, str, str], tuple[int, str]]" = OrderedDict()
+        self._maxsize = maxsize
+        self._disk = None
+        self._pending_writes: "set[asyncio.Future]" = set()
+        if directory:
+            try:
+                self._disk = diskcache.Cache(directory, size_limit=AI_DISK_CACHE_SIZE_LIMIT)
+            except Exception:
+                logger.warning(f"AI disk cache unavailable at {directory}; using memory only", exc_info=True)
+
+    async def get_many(self, keys: List[tuple[str, str, str, str]]) -> List[Optional[tuple[int, str]]]:
+        """Look up ``keys`` in memory, then fetch the misses from disk in one threadpool call."""
+        results = [self._memory.get(key) for key in keys]
+        for key, result in zip(keys, results):
+            if result is not None:
+                self._memory.move_to_end(key)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if self._disk is None or not missing:
+            return results
+
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(None, self._disk_get_many, [keys[i] for i in missing])
+        for i, result in zip(missing, found):
+            if result is not None:
+                self._remember(keys[i], result)
+                results[i] = result
+        return results
+
+    def put_many(self, items: List[tuple[tuple[str, str, str, str], tuple[int, str]]]) -> None:
+        """Store ``items`` in memory now and schedule one threadpool call to write them to disk."""
+        for key, result in items:
+            self._remember(key, result)
+        if self._disk is not None and items:
+            write = asyncio.get_running_loop().run_in_executor(None, self._disk_set_many, items)
+            self._pending_writes.add(write)
+            write.add_done_callback(self._pending_writes.discard)
+
+    async def aclose(self) -> None:
+        """Wait for scheduled disk writes, then close the disk cache."""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        if self._disk is not None:
+            self._disk.close()
+
+    def _remember(self, key: tuple[str, str, str, str], result: tuple[int, str]) -> None:
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        if len(self._memory) > self._maxsize:
+            self._memory.popitem(last=False)
+
+    def _disk_get_many(self, keys: List[tuple[str, str, str, str]]) -> List[Optional[tuple[int, str]]]:
+        try:
+            return [self._disk.get(key) for key in keys]
+        except Exception:
+            logger.warning("AI disk cache read failed", exc_info=True)
+            return [None] * len(keys)
+
+    def _disk_set_many(self, items: List[tuple[tuple[str, str, str, str], tuple[int, str]]]) -> None:
+        try:
+            # One transaction instead of a commit per entry
+            with self._disk.transact():
+                for key, result in items:
+                    self._disk.set(key, result, expire=AI_DISK_CACHE_EXPIRE_SECONDS)
+        except Exception:
+            logger.warning("AI disk cache write failed", exc_info=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared Gemini HTTP client on startup and close it on shutdown."""
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(
+            max_connections=GEMINI_POOL_SIZE,
+            max_keepalive_connections=GEMINI_POOL_SIZE,
+        ),
+    )
+    app.state.gemini_limiter = GeminiLimiter(GEMINI_CONCURRENCY, GEMINI_QPM)
+    app.state.ai_cache = AIScoreCache(AI_CACHE_SIZE, AI_DISK_CACHE_DIR)
+    # In-memory storage (in production, use a database); mutated in place so
+    # handlers can hold a stable reference across awaits
+    app.state.offer = {}
+    app.state.offer_obj = None
+    app.state.offer_use_cases_lower = []
+    app.state.leads = []
+    app.state.scored = []
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        await app.state.ai_cache.aclose()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Lead Qualification API",
     description="Backend service for scoring leads based on product/offer context",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS (allow all origins by default; tighten for production as needed)
@@ -42,24 +224,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure Gemini AI (REST)
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = "gemini-1.5-flash"
-GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-if not GEMINI_API_KEY:
-    logger.warning("GEMINI_API_KEY not found. AI scoring will use heuristic approach.")
-
-# In-memory storage (in production, use a database)
-offer_data = {}
-leads_data = []
-scored_results = []
-
 # Pydantic Models
 class Offer(BaseModel):
     name: str = Field(..., description="Product/offer name")
     value_props: List[str] = Field(..., description="Value propositions")
     ideal_use_cases: List[str] = Field(..., description="Ideal use cases")
 
+# Columns required in an uploaded leads CSV
+LEAD_COLUMNS = ['name', 'role', 'company', 'industry', 'location', 'linkedin_bio']
+# Rows written per chunk when streaming the CSV export
+CSV_EXPORT_CHUNK_ROWS = 100
+
 class Lead(BaseModel):
     name: str
     role: str
@@ -68,7 +243,14 @@ class Lead(BaseModel):
     location: str
     linkedin_bio: str
 
-class ScoredLead(BaseModel):
+# Scored results are built internally (never parsed from input), so they use a
+# slotted dataclass that orjson serializes natively instead of a Pydantic model
+@dataclass
+class ScoredLead:
+    __slots__ = (
+        'name', 'role', 'company', 'industry', 'location', 'linkedin_bio',
+        'intent', 'score', 'reasoning', 'rule_score', 'ai_score'
+    )
     name: str
     role: str
     company: str
@@ -81,115 +263,196 @@ class ScoredLead(BaseModel):
     rule_score: int
     ai_score: int
 
+# Keyword sets used by rule-based and heuristic scoring
+# Decision makers (20 points)
+DECISION_MAKERS = frozenset([
+    'ceo', 'cto', 'cfo', 'cmo', 'coo', 'president', 'founder', 'owner',
+    'head of', 'director', 'vp', 'vice president', 'chief'
+])
+# Influencers (10 points)
+INFLUENCERS = frozenset([
+    'manager', 'lead', 'senior', 'principal', 'architect', 'specialist'
+])
+# Adjacent industries (10 points)
+ADJACENT_INDUSTRIES = frozenset(['tech', 'software', 'saas', 'technology', 'digital', 'online'])
+HIGH_INTENT_ROLES = frozenset(['ceo', 'cto', 'founder', 'head of', 'director', 'vp'])
+HIGH_INTENT_INDUSTRIES = frozenset(['saas', 'technology', 'software', 'tech'])
+
+def _keyword_regex(keywords) -> re.Pattern:
+    """Compile a substring-match alternation over ``keywords`` (longest first)."""
+    return re.compile('|'.join(map(re.escape, sorted(keywords, key=len, reverse=True))))
+
+DECISION_MAKERS_RE = _keyword_regex(DECISION_MAKERS)
+INFLUENCERS_RE = _keyword_regex(INFLUENCERS)
+ADJACENT_INDUSTRIES_RE = _keyword_regex(ADJACENT_INDUSTRIES)
+HIGH_INTENT_ROLES_RE = _keyword_regex(HIGH_INTENT_ROLES)
+HIGH_INTENT_INDUSTRIES_RE = _keyword_regex(HIGH_INTENT_INDUSTRIES)
+
 # Rule-based scoring functions
 def calculate_role_score(role: str) -> int:
     """Calculate role relevance score (0-20 points)"""
     role_lower = role.lower()
-    
-    # Decision makers (20 points)
-    decision_makers = [
-        'ceo', 'cto', 'cfo', 'cmo', 'coo', 'president', 'founder', 'owner',
-        'head of', 'director', 'vp', 'vice president', 'chief'
-    ]
-    
-    # Influencers (10 points)
-    influencers = [
-        'manager', 'lead', 'senior', 'principal', 'architect', 'specialist'
-    ]
-    
-    for keyword in decision_makers:
-        if keyword in role_lower:
-            return 20
-    
-    for keyword in influencers:
-        if keyword in role_lower:
-            return 10
-    
+    if DECISION_MAKERS_RE.search(role_lower):
+        return 20
+    if INFLUENCERS_RE.search(role_lower):
+        return 10
     return 0
 
-def calculate_industry_score(industry: str, ideal_use_cases: List[str]) -> int:
-    """Calculate industry match score (0-20 points)"""
+def calculate_industry_score(industry: str, ideal_use_cases_lower: List[str]) -> int:
+    """Calculate industry match score (0-20 points)
+
+    ``ideal_use_cases_lower`` must already be lowercased (see ``create_offer``).
+    """
     industry_lower = industry.lower()
     
     # Check for exact matches in ideal use cases
-    for use_case in ideal_use_cases:
-        use_case_lower = use_case.lower()
+    for use_case_lower in ideal_use_cases_lower:
         if industry_lower in use_case_lower or use_case_lower in industry_lower:
             return 20
     
     # Check for adjacent industries
-    adjacent_keywords = ['tech', 'software', 'saas', 'technology', 'digital', 'online']
-    for keyword in adjacent_keywords:
-        if keyword in industry_lower:
-            return 10
+    if ADJACENT_INDUSTRIES_RE.search(industry_lower):
+        return 10
     
     return 0
 
 def calculate_data_completeness_score(lead: Lead) -> int:
     """Calculate data completeness score (0-10 points)"""
-    fields = [lead.name, lead.role, lead.company, lead.industry, lead.location, lead.linkedin_bio]
+    fields = (lead.name, lead.role, lead.company, lead.industry, lead.location, lead.linkedin_bio)
     complete_fields = sum(1 for field in fields if field and field.strip())
     return min(10, complete_fields * 2)  # 2 points per field, max 10
 
 def _heuristic_ai_score(lead: Lead) -> tuple[int, str]:
     """Heuristic fallback when AI is disabled or unavailable."""
-    role_lower = lead.role.lower()
-    industry_lower = lead.industry.lower()
-    high_intent_roles = ['ceo', 'cto', 'founder', 'head of', 'director', 'vp']
-    high_intent_industries = ['saas', 'technology', 'software', 'tech']
-    if any(role in role_lower for role in high_intent_roles) and any(ind in industry_lower for ind in high_intent_industries):
+    return _heuristic_score(lead.role, lead.industry)
+
+@functools.lru_cache(maxsize=4096)
+def _heuristic_score(role: str, industry: str) -> tuple[int, str]:
+    """Heuristic score for a (role, industry) pair; memoized since CSVs repeat them."""
+    high_intent_role = HIGH_INTENT_ROLES_RE.search(role.lower()) is not None
+    high_intent_industry = HIGH_INTENT_INDUSTRIES_RE.search(industry.lower()) is not None
+    if high_intent_role and high_intent_industry:
         return 50, "Heuristic: decision-maker in tech industry"
-    if any(role in role_lower for role in high_intent_roles):
+    if high_intent_role:
         return 40, "Heuristic: decision-maker role"
-    if any(ind in industry_lower for ind in high_intent_industries):
+    if high_intent_industry:
         return 35, "Heuristic: tech industry match"
     return 20, "Heuristic: baseline"
 
 
-def get_ai_score(lead: Lead, offer: Offer) -> tuple[int, str]:
-    """Get AI-based intent score and reasoning.
+def _offer_key(offer: Offer) -> str:
+    """Stable fingerprint of the model, prompt version and offer fields behind a Gemini result."""
+    text = "\x1f".join([
+        GEMINI_MODEL, AI_PROMPT_VERSION, "\x1e",
+        offer.name, *offer.value_props, "\x1e", *offer.ideal_use_cases
+    ])
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
 
-    Uses Gemini when configured; otherwise falls back to a heuristic score.
-    This function is synchronous so it can be safely called from a standard
-    FastAPI (threadpool) endpoint.
+def _ai_cache_key(offer_key: str, lead: Lead) -> tuple[str, str, str, str]:
+    """Cache key for a lead's AI score: offer plus every lead field sent in the prompt.
+
+    Role and industry are kept verbatim; name, company, location and bio are
+    hashed together, since the reasoning Gemini returns may refer to any of them.
     """
-    # Heuristic fallback if key not available
-    if not GEMINI_API_KEY:
-        score, reason = _heuristic_ai_score(lead)
-        return score, f"AI disabled: {reason}"
+    profile = "\x1f".join([lead.name, lead.company, lead.location, lead.linkedin_bio])
+    profile_hash = hashlib.blake2b(profile.encode(), digest_size=8).hexdigest()
+    return (offer_key, lead.role, lead.industry, profile_hash)
 
-    # Build prompt once
-    prompt = f"""
-        You are a B2B sales qualification expert. Analyze this lead against the product offer and classify their buying intent.
+def _retry_after_seconds(response: httpx.Response) -> float:
+    """Seconds from a numeric Retry-After header, capped; 0 when absent or invalid."""
+    try:
+        return min(float(response.headers.get("Retry-After", 0)), GEMINI_MAX_RETRY_AFTER)
+    except ValueError:
+        return 0.0
+
+def _build_batch_prompt(leads: List[Lead], offer: Offer) -> str:
+    """Build one prompt that asks Gemini to classify every lead in ``leads``."""
+    lead_blocks = "\n".join(
+        f"""
+        {index}. Name: {lead.name}
+           Role: {lead.role}
+           Company: {lead.company}
+           Industry: {lead.industry}
+           Location: {lead.location}
+           LinkedIn Bio: {lead.linkedin_bio}"""
+        for index, lead in enumerate(leads, start=1)
+    )
+    return f"""
+        You are a B2B sales qualification expert. Analyze each lead below against the product offer and classify their buying intent.
 
         PRODUCT/OFFER:
         Name: {offer.name}
         Value Propositions: {', '.join(offer.value_props)}
         Ideal Use Cases: {', '.join(offer.ideal_use_cases)}
 
-        LEAD PROFILE:
-        Name: {lead.name}
-        Role: {lead.role}
-        Company: {lead.company}
-        Industry: {lead.industry}
-        Location: {lead.location}
-        LinkedIn Bio: {lead.linkedin_bio}
+        LEADS:
+        {lead_blocks}
 
-        Task:
+        Task (for every lead):
         1) Classify intent as High, Medium, or Low.
         2) Provide a brief 1–2 sentence explanation.
 
-        Respond exactly in this format:
-        Intent: <High/Medium/Low>
-        Reasoning: <1–2 sentences>
+        Respond with only a JSON array containing one object per lead, in this format:
+        [{{"index": <lead number>, "intent": "<High/Medium/Low>", "reasoning": "<1–2 sentences>"}}]
         """
 
-    # Prepare request payload
+def _parse_batch_response(response_text: str, count: int) -> Dict[int, tuple[int, str]]:
+    """Parse Gemini's JSON array into ``{index: (score, reasoning)}``."""
+    # responseMimeType asks for bare JSON, so decode directly and only scan
+    # for an embedded array when the model wrapped it in a fence or prose
+    try:
+        rows = orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        rows = None
+    if not isinstance(rows, list):
+        match = _JSON_ARRAY_RE.search(response_text)
+        if match is None:
+            raise ValueError("AI response contained no JSON array")
+        rows = orjson.loads(match.group(0))
+
+    results = {}
+    for row in rows:
+        index = row.get("index")
+        if not isinstance(index, int) or not 1 <= index <= count:
+            continue
+        intent = str(row.get("intent", "Medium")).strip().capitalize()
+        reasoning = str(row.get("reasoning") or "").strip() or "AI provided no explanation"
+        results[index] = (INTENT_SCORES.get(intent, 30), reasoning)
+    return results
+
+async def get_ai_scores_batch(
+    leads: List[Lead],
+    offer: Offer,
+    client: httpx.AsyncClient,
+    limiter: GeminiLimiter,
+    cache: Optional[AIScoreCache] = None,
+    cache_keys: Optional[List[tuple[str, str, str, str]]] = None,
+) -> List[tuple[int, str]]:
+    """Get AI-based intent scores and reasoning for a batch of leads.
+
+    Uses Gemini when configured; otherwise falls back to a heuristic score.
+    All leads in the batch share a single request (the offer context is sent
+    once), and requests go through ``limiter`` so batches can run concurrently
+    without exceeding the Gemini quota. Successful results are stored in
+    ``cache`` under ``cache_keys`` (one per lead) when both are given.
+    """
+    # Heuristic fallback if key not available
+    if not GEMINI_API_KEY:
+        results = []
+        for lead in leads:
+            score, reason = _heuristic_ai_score(lead)
+            results.append((score, f"AI disabled: {reason}"))
+        return results
+
+    # Prepare request payload (encoded once, reused across retries)
     payload = {
         "contents": [
-            {"parts": [{"text": prompt}]}
-        ]
+            {"parts": [{"text": _build_batch_prompt(leads, offer)}]}
+        ],
+        "generationConfig": {"responseMimeType": "application/json"}
     }
+    body = orjson.dumps(payload)
+    headers = {"Content-Type": "application/json"}
     params = {"key": GEMINI_API_KEY}
 
     # Retry with exponential backoff for transient errors
@@ -197,62 +460,134 @@ def get_ai_score(lead: Lead, offer: Offer) -> tuple[int, str]:
     base_delay_seconds = 1.0
     for attempt in range(1, max_attempts + 1):
         try:
-            r = requests.post(GEMINI_URL, params=params, json=payload, timeout=30)
+            async with limiter:
+                r = await client.post(GEMINI_URL, params=params, content=body, headers=headers)
             status = r.status_code
             if status >= 500 or status in (429,):
-                raise requests.HTTPError(f"Transient HTTP {status}", response=r)
+                raise httpx.HTTPStatusError(f"Transient HTTP {status}", request=r.request, response=r)
             r.raise_for_status()
-            data = r.json()
-
-            response_text = ""
-            try:
-                response_text = data["candidates"][0]["content"]["parts"][0]["text"].strip()
-            except Exception:
-                response_text = str(data)
-
-            intent = "Medium"
-            reasoning = ""
-            for line in response_text.split('\n'):
-                if line.strip().lower().startswith("intent:"):
-                    intent = line.split(":", 1)[1].strip().capitalize()
-                elif line.strip().lower().startswith("reasoning:"):
-                    reasoning = line.split(":", 1)[1].strip()
-
-            intent_scores = {"High": 50, "Medium": 30, "Low": 10}
-            score = intent_scores.get(intent, 30)
-            if not reasoning:
-                reasoning = "AI provided no explanation"
-            return score, reasoning
-
-        except (requests.Timeout, requests.ConnectionError, requests.HTTPError) as e:
+            data = orjson.loads(r.content)
+
+            response_text = data["candidates"][0]["content"]["parts"][0]["text"]
+            parsed = _parse_batch_response(response_text, len(leads))
+
+            results = []
+            fresh = []
+            for index, lead in enumerate(leads, start=1):
+                if index in parsed:
+                    results.append(parsed[index])
+                    if cache_keys is not None:
+                        fresh.append((cache_keys[index - 1], parsed[index]))
+                else:
+                    # Model skipped this lead -> heuristic for it alone
+                    score, reason = _heuristic_ai_score(lead)
+                    results.append((score, "AI returned no result; using heuristic fallback"))
+            if cache is not None and fresh:
+                cache.put_many(fresh)
+            return results
+
+        except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as e:
             # Log sanitized error without URL or key
             status_code = getattr(getattr(e, 'response', None), 'status_code', None)
             logger.warning(f"AI call attempt {attempt}/{max_attempts} failed; status={status_code}")
             if attempt < max_attempts:
-                # Exponential backoff with jitter
+                # Exponential backoff with jitter (outside the limiter so other batches proceed)
                 sleep_s = base_delay_seconds * (2 ** (attempt - 1)) + random.uniform(0, 0.5)
-                time.sleep(sleep_s)
+                if status_code == 429:
+                    # Honour the server's hint when rate limited, within reason
+                    sleep_s = max(sleep_s, _retry_after_seconds(e.response))
+                await asyncio.sleep(sleep_s)
                 continue
             # Last attempt failed -> graceful heuristic fallback without leaking details
-            score, reason = _heuristic_ai_score(lead)
-            return score, "AI temporarily unavailable; using heuristic fallback"
+            return [
+                (_heuristic_ai_score(lead)[0], "AI temporarily unavailable; using heuristic fallback")
+                for lead in leads
+            ]
         except Exception:
-            # Non-retryable unexpected error -> heuristic
+            # Non-retryable unexpected error (including malformed JSON) -> heuristic
             logger.exception("Unexpected AI scoring error")
-            score, reason = _heuristic_ai_score(lead)
-            return score, "AI error; using heuristic fallback"
-
-def score_lead(lead: Lead, offer: Offer) -> ScoredLead:
-    """Score a single lead using rule-based and AI logic"""
-    # Rule-based scoring
-    role_score = calculate_role_score(lead.role)
-    industry_score = calculate_industry_score(lead.industry, offer.ideal_use_cases)
-    completeness_score = calculate_data_completeness_score(lead)
+            return [
+                (_heuristic_ai_score(lead)[0], "AI error; using heuristic fallback")
+                for lead in leads
+            ]
+
+async def get_ai_scores(
+    leads: List[Lead],
+    offer: Offer,
+    client: httpx.AsyncClient,
+    limiter: GeminiLimiter,
+    cache: AIScoreCache,
+) -> List[tuple[int, str]]:
+    """Get AI-based intent scores for all leads, skipping duplicate Gemini calls.
+
+    Leads already scored for this offer are served from ``cache``, and
+    leads sharing a cache key within the upload are sent to Gemini only once.
+    The remaining leads are scored in concurrent batches.
+    """
+    if not GEMINI_API_KEY:
+        return await get_ai_scores_batch(leads, offer, client, limiter)
+
+    offer_key = _offer_key(offer)
+    keys = [_ai_cache_key(offer_key, lead) for lead in leads]
+    unique_keys = list(dict.fromkeys(keys))
+    found = dict(zip(unique_keys, await cache.get_many(unique_keys)))
+    cached = [found[key] for key in keys]
+
+    # One representative lead per distinct uncached key
+    pending: Dict[tuple[str, str, str, str], Lead] = {}
+    for lead, key, result in zip(leads, keys, cached):
+        if result is None and key not in pending:
+            pending[key] = lead
+    pending_keys = list(pending)
+    pending_leads = list(pending.values())
+
+    # Fire one Gemini call per batch concurrently; the limiter bounds in-flight requests
+    tasks = [
+        get_ai_scores_batch(
+            pending_leads[i:i + GEMINI_BATCH_SIZE], offer, client, limiter,
+            cache, pending_keys[i:i + GEMINI_BATCH_SIZE],
+        )
+        for i in range(0, len(pending_leads), GEMINI_BATCH_SIZE)
+    ]
+    fresh = dict(zip(pending_keys, itertools.chain.from_iterable(await asyncio.gather(*tasks))))
+    cache_hits = sum(result is not None for result in cached)
+    logger.info(
+        f"AI scoring: {cache_hits} of {len(leads)} leads from cache, "
+        f"{len(leads) - cache_hits - len(pending)} duplicates in upload, "
+        f"{len(pending)} sent to Gemini"
+    )
+    return [result if result is not None else fresh[key] for key, result in zip(keys, cached)]
+
+def compute_rule_scores(
+    leads: List[Lead], ideal_use_cases_lower: List[str]
+) -> List[tuple[int, int, int]]:
+    """Compute (role, industry, completeness) scores for all leads in one pass.
+
+    Role and industry scores depend only on the field value, so each distinct
+    value is scored once and reused for every lead that shares it.
+    """
+    role_scores: Dict[str, int] = {}
+    industry_scores: Dict[str, int] = {}
+    results = []
+    for lead in leads:
+        role_score = role_scores.get(lead.role)
+        if role_score is None:
+            role_score = role_scores[lead.role] = calculate_role_score(lead.role)
+        industry_score = industry_scores.get(lead.industry)
+        if industry_score is None:
+            industry_score = industry_scores[lead.industry] = calculate_industry_score(
+                lead.industry, ideal_use_cases_lower
+            )
+        results.append((role_score, industry_score, calculate_data_completeness_score(lead)))
+    return results
+
+def score_lead(
+    lead: Lead, rule_scores: tuple[int, int, int], ai_score: int, ai_reasoning: str
+) -> ScoredLead:
+    """Combine precomputed rule-based and AI scores for a single lead"""
+    role_score, industry_score, completeness_score = rule_scores
     rule_score = role_score + industry_score + completeness_score
     
-    # AI scoring
-    ai_score, ai_reasoning = get_ai_score(lead, offer)
-    
     # Final score and intent
     final_score = rule_score + ai_score
     intent = "High" if final_score >= 70 else "Medium" if final_score >= 40 else "Low"
@@ -287,13 +622,17 @@ def score_lead(lead: Lead, offer: Offer) -> ScoredLead:
 @app.post("/offer")
 async def create_offer(offer: Offer):
     """Accept product/offer details"""
-    global offer_data
-    offer_data = offer.model_dump()
+    app.state.offer.clear()
+    app.state.offer.update(offer.model_dump())
+    # Keep the validated model so /score does not rebuild it from the dict
+    app.state.offer_obj = offer
+    # Lowercase once here rather than per lead in calculate_industry_score
+    app.state.offer_use_cases_lower[:] = [use_case.lower() for use_case in offer.ideal_use_cases]
     logger.info(f"Offer created: {offer.name}")
-    return {"message": "Offer created successfully", "offer": offer_data}
+    return {"message": "Offer created successfully", "offer": app.state.offer}
 
 @app.post("/leads/upload")
-async def upload_leads(file: UploadFile = File(...)):
+async def upload_leads(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Accept CSV file with lead data"""
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
@@ -305,23 +644,21 @@ async def upload_leads(file: UploadFile = File(...)):
         
         # Parse CSV
         csv_reader = csv.DictReader(io.StringIO(csv_content))
-        leads = []
         
-        for row in csv_reader:
-            # Validate required columns
-            required_columns = ['name', 'role', 'company', 'industry', 'location', 'linkedin_bio']
-            if not all(col in row for col in required_columns):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"CSV must contain columns: {', '.join(required_columns)}"
-                )
-            
-            lead = Lead(**row)
-            leads.append(lead)
+        # Validate required columns once from the header
+        if not set(LEAD_COLUMNS).issubset(csv_reader.fieldnames or ()):
+            raise HTTPException(
+                status_code=400, 
+                detail=f"CSV must contain columns: {', '.join(LEAD_COLUMNS)}"
+            )
         
-        global leads_data
-        leads_data = leads
-        logger.info(f"Uploaded {len(leads)} leads")
+        # Validation runs in pydantic-core and also rejects short rows (None values)
+        leads = [Lead.model_validate(row) for row in csv_reader]
+        
+        app.state.leads.clear()
+        app.state.leads.extend(leads)
+        # Logging is not needed for the response; run it after it is sent
+        background_tasks.add_task(logger.info, f"Uploaded {len(leads)} leads")
         
         return {"message": f"Successfully uploaded {len(leads)} leads", "count": len(leads)}
         
@@ -330,24 +667,42 @@ async def upload_leads(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail=f"Error processing CSV: {str(e)}")
 
 @app.post("/score")
-def score_leads():
+async def score_leads(background_tasks: BackgroundTasks):
     """Run scoring on uploaded leads"""
-    if not offer_data:
+    if not app.state.offer:
         raise HTTPException(status_code=400, detail="No offer data found. Please create an offer first.")
     
-    if not leads_data:
+    if not app.state.leads:
         raise HTTPException(status_code=400, detail="No leads found. Please upload leads first.")
     
     try:
-        offer = Offer(**offer_data)
-        global scored_results
-        scored_results = []
+        offer = app.state.offer_obj
+        # Snapshot inputs so a concurrent upload or offer change cannot alter them mid-run
+        leads = list(app.state.leads)
+        use_cases_lower = list(app.state.offer_use_cases_lower)
         
-        for lead in leads_data:
-            scored_lead = score_lead(lead, offer)
-            scored_results.append(scored_lead)
+        # Gemini is network-bound and dominates latency: start it first so the
+        # CPU-bound rule scoring (run once in the threadpool) overlaps with it
+        ai_task = asyncio.create_task(
+            get_ai_scores(
+                leads, offer, app.state.http, app.state.gemini_limiter, app.state.ai_cache
+            )
+        )
+        try:
+            loop = asyncio.get_running_loop()
+            rule_scores = await loop.run_in_executor(None, compute_rule_scores, leads, use_cases_lower)
+        except BaseException:
+            ai_task.cancel()
+            raise
+        ai_results = await ai_task
+        scored_results = [
+            score_lead(lead, lead_rule_scores, ai_score, ai_reasoning)
+            for lead, lead_rule_scores, (ai_score, ai_reasoning) in zip(leads, rule_scores, ai_results)
+        ]
+        # Publish in one step so /results never sees a partially scored run
+        app.state.scored[:] = scored_results
         
-        logger.info(f"Scored {len(scored_results)} leads")
+        background_tasks.add_task(logger.info, f"Scored {len(scored_results)} leads")
         return {"message": f"Successfully scored {len(scored_results)} leads", "count": len(scored_results)}
         
     except Exception as e:
@@ -357,31 +712,43 @@ def score_leads():
 @app.get("/results")
 async def get_results():
     """Return scored leads"""
-    if not scored_results:
+    if not app.state.scored:
         raise HTTPException(status_code=404, detail="No results found. Please run scoring first.")
     
-    return [result.model_dump() for result in scored_results]
+    # Serialize straight to bytes; skips FastAPI's per-field jsonable_encoder pass
+    return Response(orjson.dumps(app.state.scored), media_type="application/json")
 
 @app.get("/results/csv")
 async def export_results_csv():
     """Export results as CSV"""
-    if not scored_results:
+    if not app.state.scored:
         raise HTTPException(status_code=404, detail="No results found. Please run scoring first.")
     
-    # Create CSV content
-    output = io.StringIO()
     fieldnames = ['name', 'role', 'company', 'industry', 'location', 'linkedin_bio', 'intent', 'score', 'reasoning', 'rule_score', 'ai_score']
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
     
-    for result in scored_results:
-        writer.writerow(result.model_dump())
+    # Shallow copy: a /score finishing mid-download must not change the rows being streamed
+    results = list(app.state.scored)
     
-    csv_content = output.getvalue()
-    output.close()
+    # Async generator: a sync one would cost a threadpool hop per yielded chunk
+    async def iter_csv():
+        # Reuse one small buffer so memory stays bounded regardless of result count
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        row_values = attrgetter(*fieldnames)
+        
+        def flush() -> str:
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+        
+        writer.writerow(fieldnames)
+        for start in range(0, len(results), CSV_EXPORT_CHUNK_ROWS):
+            writer.writerows(map(row_values, results[start:start + CSV_EXPORT_CHUNK_ROWS]))
+            yield flush()
     
     return StreamingResponse(
-        io.BytesIO(csv_content.encode('utf-8')),
+        iter_csv(),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=scored_leads.csv"}
     )
@@ -396,13 +763,23 @@ async def health_check():
     """Detailed health check"""
     return {
         "status": "healthy",
-        "offer_loaded": bool(offer_data),
-        "leads_loaded": len(leads_data),
-        "results_available": len(scored_results),
+        "offer_loaded": bool(app.state.offer),
+        "leads_loaded": len(app.state.leads),
+        "results_available": len(app.state.scored),
         "ai_enabled": bool(GEMINI_API_KEY)
     }
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Offer, leads and results are held in per-process memory, so keep one worker
+    # unless that state is moved to shared storage. An app-specific variable is
+    # used because hosts such as Heroku set WEB_CONCURRENCY on their own
+    workers = max(1, int(os.getenv("UVICORN_WORKERS", "1")))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        log_level="info"
+    )